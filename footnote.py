@@ -1,5 +1,9 @@
+import bisect
+import functools
+import multiprocessing
 import os
-import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import fitz  # PyMuPDF
 from pymongo import MongoClient, UpdateOne
 
@@ -10,6 +14,10 @@ from pymongo import MongoClient, UpdateOne
 MONGO_URI = "mongodb://*"
 DB_NAME = "copyright"
 
+# Acknowledged writes (w=1) by default; set MONGO_WRITE_W=0 for
+# fire-and-forget on purely additive backfill runs.
+WRITE_CONCERN_W = int(os.environ.get("MONGO_WRITE_W", "1"))
+
 INDEX_COL = "index_todo"
 FOOTNOTE_COL = "footNote_testing"
 
@@ -29,48 +37,55 @@ def load_index_ranges(db):
     """
     Build mapping:
     {
-      pdf: [
-        { "No": ..., "start": page, "end": end_page or None }
-      ]
+      pdf: (starts, ends, nos)   # parallel lists, sorted by start page
     }
     """
-    ranges = {}
+    entries = {}
 
     for idx in db[INDEX_COL].find({}, {"pdf": 1, "page": 1, "end_page": 1, "No": 1}):
         pdf = idx.get("pdf")
         if not pdf:
             continue
 
-        entry = {
-            "No": idx.get("No"),
-            "start": idx.get("page"),
-            "end": idx.get("end_page")
-        }
-        ranges.setdefault(pdf, []).append(entry)
+        entries.setdefault(pdf, []).append(
+            (idx.get("page"), idx.get("end_page"), idx.get("No"))
+        )
 
     # 保證同一 pdf 依 start page 排序（避免錯配）
-    for pdf in ranges:
-        ranges[pdf].sort(key=lambda x: x["start"])
+    ranges = {}
+    for pdf, rows in entries.items():
+        rows.sort(key=lambda x: x[0])
+        starts = [r[0] for r in rows]
+        ends = [r[1] for r in rows]
+        nos = [r[2] for r in rows]
+        ranges[pdf] = (starts, ends, nos)
 
     return ranges
 
 
-def find_no_for_page(index_ranges, pdf, page):
+def make_no_lookup(index_ranges):
     """
-    Given pdf + page, find corresponding No.
+    Build a memoized (pdf, page) -> No lookup over the sorted start arrays.
+    Binary search replaces the old per-row linear scan.
     """
-    if pdf not in index_ranges:
-        return None
 
-    for r in index_ranges[pdf]:
-        if r["end"] is not None:
-            if r["start"] <= page <= r["end"]:
-                return r["No"]
-        else:
-            if page >= r["start"]:
-                return r["No"]
+    @functools.lru_cache(maxsize=8192)
+    def find_no_for_page(pdf, page):
+        entry = index_ranges.get(pdf)
+        if entry is None:
+            return None
+
+        starts, ends, nos = entry
+        i = bisect.bisect_right(starts, page) - 1
+        if i < 0:
+            return None
 
-    return None
+        end = ends[i]
+        if end is None or page <= end:
+            return nos[i]
+        return None
+
+    return find_no_for_page
 
 
 # =========================
@@ -80,108 +95,154 @@ def extract_footnotes(pdf_path, target_font="Helvetica", size1=6.0, size2=9.0):
     """
     Return rows: List[(page_1based, footnote_text)]
     """
-    doc = fitz.open(pdf_path)
     rows = []
+    append_row = rows.append
     collecting = False
-    footnote_text = ""
-
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        blocks = page.get_text("dict")["blocks"]
-
-        for b in blocks:
-            if "lines" not in b:
+    footnote_parts = []
+
+    # Context manager guarantees the document closes even on error
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(len(doc)):
+            page = doc.load_page(page_num)
+
+            # Cheap metadata check: pages without the footnote font at all can
+            # skip text extraction and the span walk entirely. (Footnotes never
+            # span pages here — collecting is always flushed at block end.)
+            # get_fonts() keeps the subset tag ("ABCDEF+Helvetica") that span
+            # names in get_text("dict") have stripped, so drop it before testing.
+            fonts_on_page = {f[3].rsplit("+", 1)[-1] for f in page.get_fonts()}
+            if target_font not in fonts_on_page:
                 continue
 
-            for line_num, line in enumerate(b["lines"]):
-                spans = line.get("spans", [])
-                for i, span in enumerate(spans):
-                    font_name = span.get("font", "")
-                    size = span.get("size", 0)
-                    text = span.get("text", "") or ""
-
-                    if collecting:
-                        if i < len(spans) - 1:
-                            next_text = spans[i + 1].get("text", "") or ""
-                            if text.endswith(".") and re.match(r"^[A-Z]", next_text):
-                                rows.append((page_num + 1, footnote_text.strip()))
-                                collecting = False
-                                footnote_text = ""
-                                continue
-                        footnote_text += " " + text
-
-                    if (
-                        not collecting
-                        and font_name == target_font
-                        and float(size) == float(size1)
-                        and i < len(spans) - 1
-                        and float(spans[i + 1].get("size", 0)) == float(size2)
-                    ):
-                        collecting = True
-                        footnote_text = text + " " + (spans[i + 1].get("text", "") or "").strip()
-
-                if collecting and line_num == len(b["lines"]) - 1:
-                    rows.append((page_num + 1, footnote_text.strip()))
-                    collecting = False
-                    footnote_text = ""
-
-    if collecting and footnote_text.strip():
-        rows.append((page_num + 1, footnote_text.strip()))
-
-    doc.close()
+            # One text extraction per page; the dict is walked exactly once below
+            blocks = page.get_text("dict", flags=fitz.TEXT_PRESERVE_LIGATURES)["blocks"]
+
+            for b in blocks:
+                lines = b.get("lines")
+                if not lines:
+                    continue
+
+                last_line = len(lines) - 1
+                for line_num, line in enumerate(lines):
+                    spans = line.get("spans", [])
+                    last_span = len(spans) - 1
+                    for i, span in enumerate(spans):
+                        text = span.get("text") or ""
+
+                        if collecting:
+                            if i < last_span:
+                                next_text = spans[i + 1].get("text") or ""
+                                # First-character test replaces the old ^[A-Z] regex
+                                if text.endswith(".") and next_text[:1].isupper():
+                                    append_row((page_num + 1, " ".join(footnote_parts).strip()))
+                                    collecting = False
+                                    footnote_parts = []
+                                    continue
+                            footnote_parts.append(text)
+
+                        if (
+                            not collecting
+                            and span.get("font", "") == target_font
+                            and span.get("size", 0) == size1
+                            and i < last_span
+                            and spans[i + 1].get("size", 0) == size2
+                        ):
+                            collecting = True
+                            footnote_parts = [text, (spans[i + 1].get("text") or "").strip()]
+
+                    if collecting and line_num == last_line:
+                        append_row((page_num + 1, " ".join(footnote_parts).strip()))
+                        collecting = False
+                        footnote_parts = []
+
+            # Release the page dict promptly; on very large PDFs the span
+            # dicts would otherwise pile up until the next rebinding
+            del blocks
+
+    if collecting:
+        footnote_text = " ".join(footnote_parts).strip()
+        if footnote_text:
+            rows.append((page_num + 1, footnote_text))
+
     return rows
 
 
 # =========================
 # Main pipeline
 # =========================
+def _extract_worker(filename):
+    """
+    Pool worker: extract footnotes for one PDF.
+    Runs in a child process; Mongo writes stay in the parent.
+    """
+    pdf_path = os.path.join(PDF_FOLDER, filename)
+    rows = extract_footnotes(pdf_path, TARGET_FONT, SIZE1, SIZE2)
+    return filename, rows
+
+
 def process_pdfs_with_no():
-    client = MongoClient(MONGO_URI)
+    # zstd wire compression: footnote payloads are text-heavy and compress well
+    client = MongoClient(MONGO_URI, w=WRITE_CONCERN_W, compressors="zstd")
     db = client[DB_NAME]
     foot_col = db[FOOTNOTE_COL]
 
     index_ranges = load_index_ranges(db)
+    find_no_for_page = make_no_lookup(index_ranges)
 
     pdf_files = sorted(f for f in os.listdir(PDF_FOLDER) if f.lower().endswith(".pdf"))
     print(f"Found {len(pdf_files)} PDFs")
 
     ops = []
     total = 0
-
-    for filename in pdf_files:
-        pdf_path = os.path.join(PDF_FOLDER, filename)
-        print(f"\n[PDF] {filename}")
-
-        rows = extract_footnotes(pdf_path, TARGET_FONT, SIZE1, SIZE2)
-        print(f"  extracted {len(rows)} footnotes")
-
-        for page, text in rows:
-            no_value = find_no_for_page(index_ranges, filename, page)
-
-            doc_filter = {
-                "pdf": filename,
-                "page": page,
-                "Footnote": text
-            }
-
-            doc_set = {
-                "pdf": filename,
-                "page": page,
-                "Footnote": text,
-                "No": no_value
-            }
-
-            ops.append(UpdateOne(doc_filter, {"$set": doc_set}, upsert=True))
-            total += 1
-
-            if len(ops) >= BATCH_SIZE:
-                res = foot_col.bulk_write(ops, ordered=False)
+    write_futures = []
+
+    # Bulk writes run on a small thread pool so the next PDF can be parsed
+    # while the previous batch commits (pymongo releases the GIL on socket I/O).
+    with ThreadPoolExecutor(max_workers=2) as writer_executor:
+        # Parse PDFs across cores; imap_unordered keeps fast PDFs flowing
+        # while slow ones are still being parsed.
+        with multiprocessing.Pool(os.cpu_count()) as pool:
+            for filename, rows in pool.imap_unordered(_extract_worker, pdf_files, chunksize=2):
+                print(f"\n[PDF] {filename}")
+                print(f"  extracted {len(rows)} footnotes")
+
+                for page, text in rows:
+                    no_value = find_no_for_page(filename, page)
+
+                    doc_filter = {
+                        "pdf": filename,
+                        "page": page,
+                        "Footnote": text
+                    }
+
+                    doc_set = {
+                        "pdf": filename,
+                        "page": page,
+                        "Footnote": text,
+                        "No": no_value
+                    }
+
+                    ops.append(UpdateOne(doc_filter, {"$set": doc_set}, upsert=True))
+                    total += 1
+
+                    if len(ops) >= BATCH_SIZE:
+                        # Hand the batch off and start a fresh list; never
+                        # mutate a list a writer thread may still hold.
+                        pending, ops = ops, []
+                        write_futures.append(
+                            writer_executor.submit(foot_col.bulk_write, pending, ordered=False)
+                        )
+
+        if ops:
+            write_futures.append(
+                writer_executor.submit(foot_col.bulk_write, ops, ordered=False)
+            )
+
+        for fut in as_completed(write_futures):
+            res = fut.result()
+            # With w=0 the result is unacknowledged and its counters raise
+            if res.acknowledged:
                 print(f"  [WRITE] upserted={len(res.upserted_ids)} modified={res.modified_count}")
-                ops.clear()
-
-    if ops:
-        res = foot_col.bulk_write(ops, ordered=False)
-        print(f"  [WRITE] upserted={len(res.upserted_ids)} modified={res.modified_count}")
 
     print("\n==== Done ====")
     print(f"Total footnotes processed: {total}")
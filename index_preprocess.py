@@ -60,7 +60,12 @@ FOOTNOTE_PATTERN = re.compile(r"\[\*+\d+\]")
 # Text cleaning
 # =========================
 def clean_text(text: str) -> str:
-    # Remove markers then trim spaces
+    # Remove markers then trim spaces.
+    # Fast path: most strings carry no marker, so a cheap search avoids
+    # the sub() copy (strip() alone returns the original when unchanged,
+    # which also lets build_updates skip them by equality).
+    if FOOTNOTE_PATTERN.search(text) is None:
+        return text.strip()
     return FOOTNOTE_PATTERN.sub("", text).strip()
 
 
@@ -71,13 +76,8 @@ def clean_field(value: Any) -> Any:
     if isinstance(value, str):
         return clean_text(value)
     if isinstance(value, list):
-        cleaned_list = []
-        for x in value:
-            if isinstance(x, str):
-                cleaned_list.append(clean_text(x))
-            else:
-                cleaned_list.append(x)
-        return cleaned_list
+        ct = clean_text
+        return [ct(x) if isinstance(x, str) else x for x in value]
     return value
 
 
@@ -97,10 +97,11 @@ def parse_date_str(date_str: str) -> Optional[datetime]:
         return None
 
     # Accept both "2024/1/2" and "2024/01/02"
-    # datetime.strptime("%Y/%m/%d") already supports both, as long as separators match.
+    # Manual split + int is much cheaper than strptime for this fixed format,
+    # and datetime() still validates month/day ranges for us.
     try:
-        dt = datetime.strptime(s, "%Y/%m/%d")
-        return dt.replace(tzinfo=TZ)
+        y, m, d = s.split("/")
+        return datetime(int(y), int(m), int(d), tzinfo=TZ)
     except Exception:
         return None
 
@@ -201,7 +202,10 @@ def run(query: Optional[Dict[str, Any]] = None) -> None:
             ]
         }
 
-    cursor = col.find(query)
+    # Only the cleaned/converted fields are needed; projecting them keeps
+    # network payload and BSON decoding proportional to what we touch.
+    projection = {f: 1 for f in CLEAN_FIELDS + DATE_FIELDS} | {"_id": 1}
+    cursor = col.find(query, projection).batch_size(BATCH_SIZE)
 
     ops: List[UpdateOne] = []
     seen = 0
@@ -16,12 +16,125 @@ Author
 I-Hua Lee (research pipeline version)
 """
 
+import functools
 import re
 import os
 import fitz  # PyMuPDF
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from pymongo import MongoClient
 
+try:
+    # google-re2: linear-time matching, immune to backtracking blowups
+    import re2 as _re2
+except ImportError:
+    _re2 = None
+
+
+# ============================================================
+# Precompiled patterns (module scope)
+# ============================================================
+# Compiled once at import time so repeated per-page calls do not pay
+# re-compilation / re.escape cost (and do not depend on the stdlib
+# re cache, which is LRU-bounded).
+
+# All Lexis section headers in one alternation: a single linear finditer
+# pass replaces the old per-label lazy-repetition searches over the same
+# 13-page text. "stop" markers only terminate the preceding section.
+# The colon is mandatory for the colon-labeled headers — only "Core Terms"
+# appears without one in the Lexis layout. Otherwise body lines starting
+# with e.g. "Counsel for..." or "Judge ..." would be taken for headers.
+_SECTION_SPLIT_PATTERN = (
+    r"^(?:(?P<label>(?:Subsequent History|Prior History|Disposition|"
+    r"Counsel|Judges?|Opinion by):|Core Terms)"
+    r"|(?P<stop>LexisNexis|Headnotes|HN\d+\[))"
+)
+
+# Compile with re2 when available for guaranteed linear time on adversarial
+# PDFs; the pattern avoids lookaheads so both engines accept it. The
+# legacy extract_section/extract_one_line helpers need lookahead and stay
+# on the stdlib engine.
+if _re2 is not None:
+    _SECTION_SPLIT_RE = _re2.compile(
+        _SECTION_SPLIT_PATTERN,
+        flags=_re2.MULTILINE | _re2.IGNORECASE
+    )
+else:
+    _SECTION_SPLIT_RE = re.compile(
+        _SECTION_SPLIT_PATTERN,
+        flags=re.MULTILINE | re.IGNORECASE
+    )
+
+_BEFORE_JUDGES_RE = re.compile(r"\bBefore\s+(.+?)\.", flags=re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=128)
+def _build_section_re(start_label: str, end_labels: Tuple[str, ...]) -> "re.Pattern[str]":
+    end_pat = "|".join(end_labels)
+    return re.compile(
+        rf"{re.escape(start_label)}\s+([\s\S]+?)(?=\n(?:{end_pat}))",
+        flags=re.IGNORECASE
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _build_one_line_re(label: str) -> "re.Pattern[str]":
+    return re.compile(rf"{re.escape(label)}:\s*(.+)", flags=re.IGNORECASE)
+
+
+# ============================================================
+# Helper regex functions
+# ============================================================
+
+def _scan_sections(text: str) -> Dict[str, Tuple[int, str]]:
+    """
+    One pass over the text collecting every labeled section.
+
+    Returns {label_lowercase: (header_offset, raw_content)} where content
+    runs from the end of the header to the next header/stop marker (or EOF).
+    First occurrence of a label wins, matching the old per-label searches.
+    """
+    sections: Dict[str, Tuple[int, str]] = {}
+    matches = list(_SECTION_SPLIT_RE.finditer(text))
+
+    for idx, m in enumerate(matches):
+        label = m.group("label")
+        if not label:
+            continue
+
+        key = label.rstrip(":").lower()
+        if key == "judge":
+            key = "judges"
+        if key in sections:
+            continue
+
+        end = matches[idx + 1].start() if idx + 1 < len(matches) else len(text)
+        sections[key] = (m.start(), text[m.end():end])
+
+    return sections
+
+
+def extract_section(start_label: str, end_labels: List[str], text: str, max_len=1000) -> str:
+    """
+    Extract the text between start_label and the first end label.
+
+    The compiled pattern comes from the lru_cache'd _build_section_re, so
+    repeated calls with the same (start_label, end_labels) pair across
+    documents never recompile or re-escape anything.
+    """
+    try:
+        m = _build_section_re(start_label, tuple(end_labels)).search(text)
+        if not m:
+            return ""
+        content = m.group(1).replace("\n", " ").strip()
+        return content if len(content) <= max_len else ""
+    except Exception:
+        return ""
+
+
+def extract_one_line(label: str, text: str) -> str:
+    m = _build_one_line_re(label).search(text)
+    return m.group(1).strip() if m else ""
+
 
 # ============================================================
 # Core extraction function (LIBRARY)
@@ -69,147 +182,81 @@ def extract_case_metadata_from_page(
                 f"start_page out of range: {start_page_0based} / {n_pages}"
             )
 
-        local_text = "\n".join(
-            doc[p].get_text("text")
-            for p in range(
-                start_page_0based,
-                min(start_page_0based + local_scan_pages, n_pages)
-            )
-        )
-
-        extended_text = "\n".join(
+        # Extract each scan page once; the local window is a prefix of the
+        # extended window, so both texts derive from the same pass.
+        page_texts = [
             doc[p].get_text("text")
             for p in range(
                 start_page_0based,
                 min(start_page_0based + extended_scan_pages, n_pages)
             )
-        )
+        ]
+        local_text = "\n".join(page_texts[:local_scan_pages])
+        extended_text = "\n".join(page_texts)
 
         start_page_blocks = doc[start_page_0based].get_text("dict")["blocks"]
 
     # -------------------------
-    # Helper regex functions
+    # Labeled sections (single pass)
     # -------------------------
-    def extract_prior_history_loose(text: str) -> str:
-        """
-        Looser extraction of Prior History section.
-        Designed to minimize missingness in Lexis PDFs with layout breaks.
-        """
-        try:
-            pattern = (
-                r"Prior History[:\s]+"
-                r"([\s\S]+?)"
-                r"(?=\n(?:Disposition:|Core Terms|Subsequent History:|"
-                r"LexisNexis|Headnotes|HN\d+\[|$))"
-            )
-            m = re.search(pattern, text, flags=re.IGNORECASE)
-            if not m:
-                return ""
-            content = m.group(1).replace("\n", " ").strip()
-            return content
-        except Exception:
-            return ""
+    # local_text is a prefix of extended_text, so one scan of the extended
+    # text serves both windows: a section counts as "local" when its header
+    # starts inside the local prefix.
 
+    sections = _scan_sections(extended_text)
+    local_len = len(local_text)
 
-    def extract_section(start_label: str, end_labels: List[str], text: str, max_len=1000) -> str:
-        try:
-            end_pat = "|".join(end_labels)
-            m = re.search(
-                rf"{re.escape(start_label)}\s+([\s\S]+?)(?=\n(?:{end_pat}))",
-                text,
-                flags=re.IGNORECASE
-            )
-            if not m:
-                return ""
-            content = m.group(1).replace("\n", " ").strip()
-            return content if len(content) <= max_len else ""
-        except Exception:
+    def section(key: str, max_len: int = None, local_only: bool = False) -> str:
+        entry = sections.get(key)
+        if entry is None:
             return ""
-
-    def extract_one_line(label: str, text: str) -> str:
-        m = re.search(rf"{re.escape(label)}:\s*(.+)", text, flags=re.IGNORECASE)
-        return m.group(1).strip() if m else ""
+        start, content = entry
+        if local_only and start >= local_len:
+            return ""
+        content = content.replace("\n", " ").strip()
+        if max_len is not None and len(content) > max_len:
+            return ""
+        return content
 
     # -------------------------
     # Core Terms
     # -------------------------
 
-    core_terms_raw = extract_section(
-        "Core Terms",
-        end_labels=[
-            r"Counsel:",
-            r"LexisNexis",
-            r"Headnotes",
-            r"HN\d+\[",
-            r"Opinion by:",
-            r"Judges?:"
-        ],
-        text=local_text,
-        max_len=2000
-    )
+    core_terms_raw = section("core terms", max_len=2000, local_only=True)
     core_terms = [t.strip() for t in core_terms_raw.split(",")] if core_terms_raw else []
 
     # -------------------------
     # Judges
     # -------------------------
 
-    judges = extract_section(
-        "Judges:",
-        [r"Opinion by:", r"Core Terms", r"Counsel:"],
-        local_text,
-        max_len=300
-    )
+    judges = section("judges", max_len=300, local_only=True)
 
     if not judges:
-        m = re.search(r"\bBefore\s+(.+?)\.", extended_text, flags=re.IGNORECASE)
+        m = _BEFORE_JUDGES_RE.search(extended_text)
         if m:
             judges = m.group(1).strip()
     # -------------------------
     # Counsel
     # -------------------------
-    counsel = ""
-    try:
-        match = re.search(
-            r'Counsel:\s*(.+?)(?=\n(?:HN\d+\[|Headnotes|Judges?:|Opinion by:|'
-            r'Core Terms|Subsequent History:|Prior History:|Disposition:|$))',
-            extended_text,
-            flags=re.DOTALL | re.IGNORECASE
-        )
-        if match:
-            counsel = match.group(1).replace("\n", " ").strip()
-    except Exception:
-        counsel = ""
+
+    counsel = section("counsel")
 
     # -------------------------
     # Opinion by
     # -------------------------
 
-    opinion_by = extract_one_line("Opinion by", extended_text)
+    # One-line field: skip leading whitespace (the value often lands on the
+    # line after the header in extracted PDF text), then keep the first line
+    opinion_entry = sections.get("opinion by")
+    opinion_by = opinion_entry[1].lstrip().split("\n", 1)[0].strip() if opinion_entry else ""
 
     # -------------------------
     # Prior / Subsequent history
     # -------------------------
 
-    # prior_history = ""
-    # m = re.search(r"Prior History:\s*(.+)", local_text, flags=re.IGNORECASE)
-    # if m:
-    #     prior_history = re.sub(r"^\[\*\*\d+\]\s*", "", m.group(1).strip())
-    prior_history = extract_prior_history_loose(local_text)
-
-    
-
-    subsequent_history = extract_section(
-        "Subsequent History:",
-        end_labels=[
-            r"Prior History:",
-            r"Disposition:",
-            r"Core Terms",
-            r"LexisNexis",
-            r"Headnotes"
-        ],
-        text=local_text,
-        max_len=1000
-    )
+    prior_history = section("prior history", local_only=True)
+
+    subsequent_history = section("subsequent history", max_len=1000, local_only=True)
 
     # -------------------------
     # Caption (Plaintiff v. Defendant)
@@ -1,7 +1,7 @@
 import os
 import re
 import fitz  # PyMuPDF
-from pymongo import MongoClient
+from pymongo import MongoClient, InsertOne
 
 # ======================================================
 # MongoDB configuration
@@ -10,7 +10,12 @@ MONGO_URI = "mongodb://*"
 DB_NAME = "copyright"
 COLLECTION_NAME = "opinion_testing"
 
-client = MongoClient(MONGO_URI)
+# Acknowledged writes (w=1) by default; set MONGO_WRITE_W=0 for
+# fire-and-forget on purely additive runs. zstd compresses the
+# text-heavy opinion payloads on the wire.
+WRITE_CONCERN_W = int(os.environ.get("MONGO_WRITE_W", "1"))
+
+client = MongoClient(MONGO_URI, w=WRITE_CONCERN_W, compressors="zstd")
 db = client[DB_NAME]
 collection = db[COLLECTION_NAME]
 
@@ -18,10 +23,10 @@ collection = db[COLLECTION_NAME]
 # Patterns for Opinion extraction
 # ======================================================
 # Trigger keyword for starting an Opinion section
-opinion_pattern = r"Opinion"
+OPINION_KEYWORD = "Opinion"
 
 # Marker indicating the end of the document
-end_pattern = r"End of Document"
+END_MARKER = "End of Document"
 
 # Pattern used to remove page number artifacts (e.g., "Page 3 of 25")
 page_marker_pattern = re.compile(
@@ -29,6 +34,13 @@ page_marker_pattern = re.compile(
     flags=re.IGNORECASE
 )
 
+# Fonts that carry Opinion body text (set membership is one hash lookup)
+BODY_FONTS = frozenset({
+    "Helvetica",
+    "Helvetica-BoldOblique",
+    "Helvetica-Oblique"
+})
+
 # ======================================================
 # PDF configuration
 # ======================================================
@@ -41,25 +53,38 @@ doc = fitz.open(pdf_path)
 # State variables for cross-page Opinion extraction
 # ======================================================
 opinion_started = False            # Whether an Opinion section is currently being collected
-page_text = ""                     # Accumulated Opinion text across pages
+page_text_parts = []               # Accumulated Opinion text across pages (joined on save)
 urls_dic_accumulated = []          # Accumulated hyperlinks across Opinion pages
 opinion_id = 0                     # Sequential Opinion identifier
 start_page_1based = None           # Starting page of the current Opinion (1-based)
 
+# Pending inserts, flushed in batches to amortize driver round-trips
+ops = []
+OPS_BATCH_SIZE = 500
+
+
+def flush_ops():
+    """Send pending InsertOne ops in one unordered bulk_write."""
+    global ops
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        ops = []
+
 # ======================================================
 # Helper function: extract hyperlinks from a page
 # ======================================================
-def get_page_links(page):
+def get_page_links(page, textpage=None):
     """
     Extract all URI hyperlinks from a PDF page.
     Each link is stored as a dictionary with raw anchor text and URL.
+    An existing TextPage can be passed in to avoid re-running text layout.
     """
     urls_dic = []
     for link in page.get_links():
         if "uri" in link:
             uri = link["uri"]
             rect = fitz.Rect(link["from"])
-            link_text = page.get_textbox(rect) or ""
+            link_text = page.get_textbox(rect, textpage=textpage) or ""
             urls_dic.append({
                 "raw_text": link_text.strip(),
                 "link": uri
@@ -74,11 +99,15 @@ for page_num in range(len(doc)):
     page = doc.load_page(page_num)
     page_1based = page_num + 1
 
+    # One TextPage serves both the link anchors and the dict extraction,
+    # so MuPDF's layout analysis runs once per page
+    tp = page.get_textpage()
+
     # Collect and accumulate hyperlinks from the current page
-    urls_dic = get_page_links(page)
+    urls_dic = get_page_links(page, tp)
     urls_dic_accumulated += urls_dic
 
-    blocks = page.get_text("dict").get("blocks", [])
+    blocks = page.get_text("dict", textpage=tp).get("blocks", [])
     for block in blocks:
         if "lines" not in block:
             continue
@@ -96,19 +125,22 @@ for page_num in range(len(doc)):
                 #   - Font: Helvetica-Bold
                 #   - Text contains the keyword "Opinion"
                 # --------------------------------------------------
-                if size == 14.0 and font == "Helvetica-Bold" and re.search(opinion_pattern, text):
+                if size == 14.0 and font == "Helvetica-Bold" and OPINION_KEYWORD in text:
                     # If an Opinion is already open, save it before starting a new one
-                    if opinion_started and page_text.strip():
-                        collection.insert_one({
+                    if opinion_started and page_text_parts:
+                        content = page_marker_pattern.sub("", " ".join(page_text_parts)).strip()
+                        ops.append(InsertOne({
                             "pdf": pdf_name,
                             "opinion_id": opinion_id,
                             "start_page": start_page_1based,
                             "end_page": page_1based - 1,
-                            "content": page_text.strip(),
+                            "content": content,
                             "urls_dic": urls_dic_accumulated
-                        })
+                        }))
+                        if len(ops) >= OPS_BATCH_SIZE:
+                            flush_ops()
                         opinion_id += 1
-                        page_text = ""
+                        page_text_parts = []
                         urls_dic_accumulated = []
 
                     opinion_started = True
@@ -122,49 +154,53 @@ for page_num in range(len(doc)):
                 #   - Font size: 10
                 #   - Font family: Helvetica variants
                 # --------------------------------------------------
-                if opinion_started and size == 10 and font in [
-                    "Helvetica",
-                    "Helvetica-BoldOblique",
-                    "Helvetica-Oblique"
-                ]:
+                if opinion_started and size == 10 and font in BODY_FONTS:
                     if text:
-                        page_text += " " + text
-                        # Remove page number artifacts during accumulation
-                        page_text = page_marker_pattern.sub("", page_text).strip()
+                        # Accumulate raw parts; they are joined and cleaned
+                        # once when the Opinion is saved, not per span
+                        page_text_parts.append(text)
 
                 # --------------------------------------------------
                 # Detect the end of the Opinion section
                 # --------------------------------------------------
-                if opinion_started and re.search(end_pattern, text):
-                    page_text = re.sub(end_pattern, "", page_text).strip()
-                    collection.insert_one({
+                if opinion_started and END_MARKER in text:
+                    content = page_marker_pattern.sub("", " ".join(page_text_parts))
+                    content = content.replace(END_MARKER, "").strip()
+                    ops.append(InsertOne({
                         "pdf": pdf_name,
                         "opinion_id": opinion_id,
                         "start_page": start_page_1based,
                         "end_page": page_1based,
-                        "content": page_text,
+                        "content": content,
                         "urls_dic": urls_dic_accumulated
-                    })
+                    }))
+                    if len(ops) >= OPS_BATCH_SIZE:
+                        flush_ops()
                     opinion_id += 1
                     opinion_started = False
-                    page_text = ""
+                    page_text_parts = []
                     urls_dic_accumulated = []
                     # Continue scanning remaining content if any
 
+    # Drop the TextPage reference so MuPDF can free it before the next page
+    tp = None
+
 # ======================================================
 # Finalization: save any unfinished Opinion at EOF
 # ======================================================
-if opinion_started and page_text.strip():
-    collection.insert_one({
+if opinion_started and page_text_parts:
+    ops.append(InsertOne({
         "pdf": pdf_name,
         "opinion_id": opinion_id,
         "start_page": start_page_1based,
         "end_page": len(doc),
-        "content": page_text.strip(),
+        "content": page_marker_pattern.sub("", " ".join(page_text_parts)).strip(),
         "urls_dic": urls_dic_accumulated
-    })
+    }))
+    flush_ops()
     print(f"Final Opinion saved. Total opinions: {opinion_id + 1}")
 else:
+    flush_ops()
     print(f"Total opinions saved: {opinion_id}")
 
 doc.close()